@@ -1,3 +1,14 @@
-from setuptools import setup
+from setuptools import setup, Extension
+
+try:
+    from Cython.Build import cythonize
+except ImportError:
+    ext_modules = []
+else:
+    # optional, the pure Python kernels are used if the build fails
+    ext_modules = cythonize([Extension('id3._splitter',
+                                       ['src/id3/_splitter.pyx'],
+                                       optional=True)])
+
 if __name__ == '__main__':
-    setup()
+    setup(ext_modules=ext_modules)
@@ -0,0 +1,100 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+# cython: initializedcheck=False
+""" Compiled versions of the split kernels in splitter.py, used in place of
+the numba and NumPy versions when the extension is built
+"""
+import numpy as np
+from libc.math cimport INFINITY
+from libc.stdint cimport int32_t, int64_t
+
+ctypedef fused value_t:
+    float
+    double
+    int32_t
+    int64_t
+
+ctypedef fused class_t:
+    int32_t
+    int64_t
+
+
+def numerical_split_infos(const value_t[::1] sorted_x,
+                          const class_t[::1] inv,
+                          int n_classes,
+                          const double[::1] xlog2x):
+    """ Weighted information per split position of a sorted feature, see
+    splitter._numerical_split_infos_np
+    """
+    cdef Py_ssize_t n = inv.shape[0]
+    cdef Py_ssize_t i
+    cdef class_t c
+    cdef double s_left = 0.0
+    cdef double s_right = 0.0
+    cdef double term, info
+    cdef double best = INFINITY
+    cdef double bound = INFINITY
+    infos = np.empty(max(n - 1, 0))
+    cnt_left = np.zeros(n_classes, dtype=np.int32)
+    cnt_right = np.zeros(n_classes, dtype=np.int32)
+    term_left = np.zeros(n_classes)
+    term_right = np.zeros(n_classes)
+    cdef double[::1] infos_view = infos
+    cdef int32_t[::1] left = cnt_left
+    cdef int32_t[::1] right = cnt_right
+    cdef double[::1] t_left = term_left
+    cdef double[::1] t_right = term_right
+    with nogil:
+        for i in range(n):
+            right[inv[i]] += 1
+        for c in range(n_classes):
+            t_right[c] = xlog2x[right[c]]
+            s_right += t_right[c]
+        for i in range(1, n):
+            c = inv[i - 1]
+            left[c] += 1
+            right[c] -= 1
+            term = xlog2x[left[c]]
+            s_left += term - t_left[c]
+            t_left[c] = term
+            # the left side alone is past best, so is every later position
+            if xlog2x[i] - s_left > bound:
+                infos_view[i - 1:] = INFINITY
+                break
+            term = xlog2x[right[c]]
+            s_right += term - t_right[c]
+            t_right[c] = term
+            info = (xlog2x[i] - s_left) + (xlog2x[n - i] - s_right)
+            info = INFINITY if sorted_x[i - 1] == sorted_x[i] else info
+            infos_view[i - 1] = info
+            if info < best:
+                best = info
+                bound = best + 1e-9 * (best if best > 1.0 else 1.0)
+    return infos
+
+
+def nominal_info(const int32_t[::1] values,
+                 const class_t[::1] y,
+                 int n_values,
+                 int n_classes,
+                 const double[::1] xlog2x):
+    """ Weighted information and value counts of a nominal feature, see
+    splitter._nominal_info_np
+    """
+    cdef Py_ssize_t n = values.shape[0]
+    cdef Py_ssize_t i, v, c
+    cdef double info = 0.0
+    cdef double s
+    tab = np.zeros(n_values * n_classes, dtype=np.intp)
+    count = np.zeros(n_values, dtype=np.intp)
+    cdef Py_ssize_t[::1] tab_view = tab
+    cdef Py_ssize_t[::1] count_view = count
+    with nogil:
+        for i in range(n):
+            tab_view[values[i] * n_classes + y[i]] += 1
+            count_view[values[i]] += 1
+        for v in range(n_values):
+            s = 0.0
+            for c in range(n_classes):
+                s += xlog2x[tab_view[v * n_classes + c]]
+            info += xlog2x[count_view[v]] - s
+    return info, count
@@ -24,6 +24,9 @@ class Id3Estimator(BaseEstimator):
         use gain ratio on split calculations.
     is_repeating: bool, optional (default=False)
         use repeating features.
+    n_jobs : int, optional (default=None)
+        number of threads evaluating the features of a node in parallel.
+        None means 1, -1 means using all processors.
 
     Attributes
     ----------
@@ -33,6 +36,7 @@ class Id3Estimator(BaseEstimator):
     gain_ratio : bool
     min_entropy_decrease : float
     is_repeating : bool
+    n_jobs : int
     """
 
     def __init__(self,
@@ -41,13 +45,15 @@ class Id3Estimator(BaseEstimator):
                  prune=False,
                  gain_ratio=False,
                  min_entropy_decrease=0.0,
-                 is_repeating=False):
+                 is_repeating=False,
+                 n_jobs=None):
         self.max_depth = max_depth
         self.min_samples_split = min_samples_split
         self.prune = prune
         self.gain_ratio = gain_ratio
         self.min_entropy_decrease = min_entropy_decrease
         self.is_repeating = is_repeating
+        self.n_jobs = n_jobs
 
     def fit(self, X, y, check_input=True):
         """Build a decision tree based on samples X and
@@ -92,7 +98,8 @@ class Id3Estimator(BaseEstimator):
         """
         X_, y_ = check_X_y(X, y, dtype='object')
         self.y_encoder_ = ExtendedLabelEncoder()
-        y_ = self.y_encoder_.fit_transform(y_)
+        # int32 class indices, shared by the splitter and the builder
+        y_ = self.y_encoder_.fit_transform(y_).astype(np.int32)
 
         max_np_int = np.iinfo(np.int32).max
         if not isinstance(self.max_depth, (numbers.Integral, np.integer)):
@@ -116,7 +123,8 @@ class Id3Estimator(BaseEstimator):
 
         _, self.n_features_ = X_.shape
         self.is_numerical_ = [False] * self.n_features_
-        X_tmp = np.zeros(X_.shape, dtype=np.float32)
+        # column major like the splitter's copy, so both share it
+        X_tmp = np.zeros(X_.shape, dtype=np.float32, order='F')
         self.X_encoders_ = [ExtendedLabelEncoder() for _ in
                             range(self.n_features_)]
         for i in range(self.n_features_):
@@ -135,7 +143,8 @@ class Id3Estimator(BaseEstimator):
                             y_,
                             self.is_numerical_,
                             self.X_encoders_,
-                            self.gain_ratio)
+                            self.gain_ratio,
+                            self.n_jobs)
 
         self.builder_ = TreeBuilder(splitter,
                                     self.y_encoder_,
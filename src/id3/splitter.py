@@ -1,10 +1,188 @@
+import threading
 import numpy as np
+from joblib import Parallel, delayed
 from .utils import unique
 
+try:
+    from . import _splitter
+except ImportError:
+    _splitter = None
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+def _xlog2x(n):
+    """ :math: c \\log_{2}(c) :math: for c = 0..n, with 0 for c = 0
+
+    The only logarithms of a fit are taken here, in one float64 pass that
+    NumPy dispatches to its SIMD log2 loop, the split kernels use the table.
+    """
+    c = np.arange(n + 1, dtype=np.float64)
+    # 1 log2(1) is 0 too, this avoids a masked pass for c = 0
+    c[0] = 1
+    xlog2x = np.log2(c)
+    xlog2x *= c
+    return xlog2x
+
+
+def _argsort(x):
+    """ Argsort of a numerical feature
+
+    Integer valued features spanning more than 256 values are shifted into
+    uint16 and sorted with NumPy's stable sort, which is a radix sort for
+    16 bit keys. Quicksort is faster on features with fewer distinct values.
+    """
+    if x.size > 0:
+        lo, hi = np.min(x), np.max(x)
+        if 256 <= hi - lo <= np.iinfo(np.uint16).max:
+            keys = (x - lo).astype(np.uint16)
+            if np.array_equal(keys, x - lo):
+                return np.argsort(keys, kind='stable')
+    return np.argsort(x, kind='quicksort')
+
+
+def _numerical_split_infos_np(sorted_x, inv, n_classes, xlog2x):
+    """ Weighted information :math: i H(left) + (n - i) H(right) :math: for
+    every split position i = 1..n-1 of a sorted feature
+
+    Moving example i - 1 from the right to the left side only changes the
+    count of its own class, so the sums :math: \\sum_{c} c \\log_{2}(c) :math:
+    of both sides are updated by one term per position instead of being
+    recomputed over all classes.
+
+    Parameters
+    ----------
+    sorted_x : np.array of shape [n remaining examples]
+        sorted feature values
+    inv : np.array of shape [n remaining examples] of int32
+        class index in 0..n_classes-1 of every sorted example
+    n_classes : int
+    xlog2x : np.array of shape [> n remaining examples]
+        table of :math: c \\log_{2}(c) :math: indexed by the count c
+
+    Returns
+    -------
+    : np.array of shape [n remaining examples - 1]
+        weighted information per split position, inf between equal values;
+        the compiled versions stop scanning once the rest cannot come within
+        1e-9 relative of the minimum and return inf for those positions
+    """
+    n = inv.size
+    totals = np.bincount(inv, minlength=n_classes).astype(np.int32)
+    # rank of every example among the preceding examples of its class
+    order = np.argsort(inv, kind='stable')
+    rank = np.empty(n, dtype=np.int32)
+    rank[order] = (np.arange(n, dtype=np.int32)
+                   - (np.cumsum(totals) - totals)[inv[order]])
+    right = totals[inv] - rank
+    s_left = np.cumsum(xlog2x[rank + 1] - xlog2x[rank])[:-1]
+    s_right = (np.sum(xlog2x[totals])
+               + np.cumsum(xlog2x[right - 1] - xlog2x[right])[:-1])
+    i = np.arange(1, n, dtype=np.int32)
+    infos = (xlog2x[i] - s_left) + (xlog2x[n - i] - s_right)
+    infos[sorted_x[1:] == sorted_x[:-1]] = np.inf
+    return infos
+
+
+def _nominal_info_np(values, y, n_values, n_classes, xlog2x):
+    """ Weighted information :math: \\sum_{v} |S_v| H(S_v) :math: of a nominal
+    feature from the contingency table of its values against the classes
+
+    Parameters
+    ----------
+    values : np.array of int32 of shape [n remaining examples]
+        encoded feature values in 0..n_values-1
+    y : np.array of shape [n remaining examples]
+        class index in 0..n_classes-1 of every example
+    n_values : int
+    n_classes : int
+    xlog2x : np.array of shape [> n remaining examples]
+        table of :math: c \\log_{2}(c) :math: indexed by the count c
+
+    Returns
+    -------
+    : float
+        weighted information
+    : np.array of shape [n_values]
+        number of examples per value
+    """
+    key = values * n_classes + y
+    tab = np.bincount(key, minlength=n_values * n_classes)
+    tab = tab.reshape(n_values, n_classes)
+    count = np.sum(tab, axis=1)
+    info = np.sum(xlog2x[count] - np.sum(xlog2x[tab], axis=1))
+    return info, count
+
+
+def _numerical_split_infos_nb(sorted_x, inv, n_classes, xlog2x):
+    """ Loop version of _numerical_split_infos_np compiled with numba """
+    n = inv.size
+    cnt_right = np.zeros(n_classes, dtype=np.int32)
+    for i in range(n):
+        cnt_right[inv[i]] += 1
+    cnt_left = np.zeros(n_classes, dtype=np.int32)
+    # current c log2(c) term of every class on both sides
+    term_left = np.zeros(n_classes)
+    term_right = np.empty(n_classes)
+    s_left = 0.0
+    s_right = 0.0
+    for c in range(n_classes):
+        term_right[c] = xlog2x[cnt_right[c]]
+        s_right += term_right[c]
+    infos = np.empty(n - 1)
+    best = np.inf
+    bound = np.inf
+    for i in range(1, n):
+        c = inv[i - 1]
+        cnt_left[c] += 1
+        cnt_right[c] -= 1
+        term = xlog2x[cnt_left[c]]
+        s_left += term - term_left[c]
+        term_left[c] = term
+        # the weighted entropy of the left side never decreases, no later
+        # position can get within the candidate tolerance of best
+        if xlog2x[i] - s_left > bound:
+            infos[i - 1:] = np.inf
+            break
+        term = xlog2x[cnt_right[c]]
+        s_right += term - term_right[c]
+        term_right[c] = term
+        info = (xlog2x[i] - s_left) + (xlog2x[n - i] - s_right)
+        # evaluated at every position so the tie test compiles to a select
+        # instead of a branch that mispredicts on noisy data
+        info = np.inf if sorted_x[i - 1] == sorted_x[i] else info
+        infos[i - 1] = info
+        if info < best:
+            best = info
+            bound = best + 1e-9 * max(best, 1.0)
+    return infos
+
+
+# fastmath without the nnan and ninf flags, ties are marked with inf
+_fastmath = {'nsz', 'arcp', 'contract', 'afn', 'reassoc'}
+
+# the compiled extension if it was built, otherwise numba, otherwise NumPy
+if _splitter is not None:
+    _numerical_split_infos = _splitter.numerical_split_infos
+elif njit is not None:
+    _numerical_split_infos = njit(cache=True, nogil=True, fastmath=_fastmath)(
+        _numerical_split_infos_nb)
+else:
+    _numerical_split_infos = _numerical_split_infos_np
+
+if _splitter is not None:
+    _nominal_info = _splitter.nominal_info
+else:
+    _nominal_info = _nominal_info_np
+
 
 class SplitRecord():
     LESS = 0
     GREATER = 1
+    __slots__ = ('calc_record', 'bag', 'value_encoded', 'size')
 
     def __init__(self, calc_record, bag, value_encoded):
         self.calc_record = calc_record
@@ -16,6 +194,9 @@ class SplitRecord():
 class CalcRecord():
     NUM = 0
     NOM = 1
+    __slots__ = ('split_type', 'info', 'feature_idx', 'entropy', 'pivot',
+                 'attribute_counts', 'class_counts', 'gain_ratio',
+                 'alive_features')
 
     def __init__(self,
                  split_type,
@@ -44,13 +225,29 @@ class CalcRecord():
 
 
 class Splitter():
-
-    def __init__(self, X, y, is_numerical, encoders, gain_ratio=False):
-        self.X = X
-        self.y = y
+    # smaller nodes evaluate their features serially even if n_jobs > 1
+    min_parallel_samples = 10000
+
+    def __init__(self, X, y, is_numerical, encoders, gain_ratio=False,
+                 n_jobs=None):
+        # column major so the features of a subset are gathered from
+        # contiguous memory
+        self.X = X if X is None else np.asfortranarray(X)
+        # classes are label encoded, so they index the class counts directly
+        self.y = y if y is None else y.astype(np.int32, copy=False)
+        self._n_classes = None if y is None else int(np.max(y)) + 1
         self.is_numerical = is_numerical
         self.encoders = encoders
         self.gain_ratio = gain_ratio
+        self.n_jobs = n_jobs
+        self._buffers = threading.local()
+        self._xlog2x = None
+        if y is not None:
+            self._xlog2x_table(y.shape[0])
+        self._encoded_classes = None
+        if encoders is not None:
+            self._encoded_classes = [encoder.encoded_classes_
+                                     for encoder in encoders]
 
     def _entropy(self, y, return_class_counts=False):
         """ Entropy for the classes in the array y
@@ -71,13 +268,93 @@ class Splitter():
         if n <= 0:
             return 0
         classes, count = unique(y)
-        p = np.true_divide(count, n)
-        res = np.abs(np.sum(np.multiply(p, np.log2(p))))
+        res = self._entropy_counts(count)
         if return_class_counts:
-            return res, np.vstack((classes, count)).T
+            class_counts = np.empty((classes.size, 2), dtype=np.intp)
+            class_counts[:, 0] = classes
+            class_counts[:, 1] = count
+            return res, class_counts
         else:
             return res
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_buffers']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._buffers = threading.local()
+
+    def release(self):
+        """ Drop the scratch buffers and the c log2(c) table once the tree is
+        built, both are rebuilt when calc is called again
+        """
+        self._buffers = threading.local()
+        self._xlog2x = None
+
+    def _buffer(self, name, n, dtype):
+        """ Scratch array of n elements reused by every call of the current
+        thread, so gathering the examples of a node does not allocate.
+        Nothing returned by the splitter may reference it.
+
+        Buffers grow to the largest node seen by the thread. The workers of
+        a parallel calc are new threads every time, so the reuse happens on
+        the serial path, i.e. n_jobs=1 and nodes below min_parallel_samples.
+        """
+        buffer = getattr(self._buffers, name, None)
+        if buffer is None or buffer.size < n or buffer.dtype != dtype:
+            buffer = np.empty(n, dtype=dtype)
+            setattr(self._buffers, name, buffer)
+        return buffer[:n]
+
+    def _n_classes_of(self, y):
+        """ Number of classes for the label encoded classes y """
+        if self._n_classes is not None:
+            return self._n_classes
+        return int(np.max(y)) + 1
+
+    def _xlog2x_table(self, n):
+        """ Lookup table of :math: c \\log_{2}(c) :math: for c = 0..n, the
+        entropy of counts c summing to n is
+        :math: (n \\log_{2}(n) - \\sum c \\log_{2}(c)) / n :math:, so
+        entropies are computed with table loads instead of logarithms
+        """
+        if self._xlog2x is None or self._xlog2x.size <= n:
+            self._xlog2x = _xlog2x(n)
+        return self._xlog2x
+
+    def _weighted_entropy_counts(self, count):
+        """ Entropy times the number of examples for a class distribution
+        given by its counts
+
+        Parameters
+        ----------
+        count : nparray of int of shape [n classes]
+            containing the number of examples per class
+
+        Returns
+        -------
+        : float
+        """
+        n = np.sum(count)
+        xlog2x = self._xlog2x_table(n)
+        return xlog2x[n] - np.sum(xlog2x[count])
+
+    def _entropy_counts(self, count):
+        """ Entropy of a class distribution given by its counts
+
+        Parameters
+        ----------
+        count : nparray of int of shape [n classes]
+            containing the number of examples per class
+
+        Returns
+        -------
+        : float
+        """
+        return self._weighted_entropy_counts(count) / np.sum(count)
+
     def _info_nominal(self, x, y):
         """ Info for nominal feature feature_values
         :math: p(a)H(a) :math: from
@@ -95,14 +372,14 @@ class Splitter():
         : float
             information for remaining examples given feature
         """
-        info = 0
         n = x.shape[0]
-        items, count = unique(x)
-        for value, p in zip(items, count):
-            info += p * self._entropy(y[x == value])
+        values = x.astype(np.int32)
+        info, count = _nominal_info(values, y, int(np.max(values)) + 1,
+                                    self._n_classes_of(y),
+                                    self._xlog2x_table(n))
         return CalcRecord(CalcRecord.NOM,
                           info * np.true_divide(1, n),
-                          attribute_counts=count)
+                          attribute_counts=count[count > 0])
 
     def _info_numerical(self, x, y):
         """ Info for numerical feature feature_values
@@ -123,47 +400,66 @@ class Splitter():
             pivot used set1 < pivot <= set2
         """
         n = x.size
-        sorted_idx = np.argsort(x, kind='quicksort')
-        sorted_y = np.take(y, sorted_idx, axis=0)
-        sorted_x = np.take(x, sorted_idx, axis=0)
+        sorted_idx = _argsort(x)
+        # sorted_idx is a permutation of 0..n-1, clip only skips the check
+        sorted_y = np.take(y, sorted_idx, mode='clip',
+                           out=self._buffer('sorted_y', n, y.dtype))
+        sorted_x = np.take(x, sorted_idx, mode='clip',
+                           out=self._buffer('sorted_x', n, x.dtype))
         min_info = float('inf')
         min_info_pivot = 0
-        min_attribute_counts = np.empty(2)
-        for i in range(1, n):
-            if sorted_x[i - 1] != sorted_x[i]:
-                tmp_info = i * self._entropy(sorted_y[0: i]) + \
-                           (n - i) * self._entropy(sorted_y[i:])
-                if tmp_info < min_info:
-                    min_attribute_counts[SplitRecord.LESS] = i
-                    min_attribute_counts[SplitRecord.GREATER] = n - i
-                    min_info = tmp_info
-                    min_info_pivot = (sorted_x[i - 1] + sorted_x[i]) / 2.0
+        min_attribute_counts = np.zeros(2, dtype=np.intp)
+        if n > 1:
+            n_classes = self._n_classes_of(y)
+            infos = _numerical_split_infos(sorted_x, sorted_y, n_classes,
+                                           self._xlog2x_table(n))
+            # the running sums are only accurate up to rounding, recompute
+            # the near optimal positions exactly, ties go to the first one
+            best_info = np.min(infos)
+            if best_info < min_info:
+                candidates = np.flatnonzero(infos <= best_info
+                                            + 1e-9 * max(best_info, 1.0))
+                for split in candidates + 1:
+                    left = np.bincount(sorted_y[:split], minlength=n_classes)
+                    right = np.bincount(sorted_y[split:], minlength=n_classes)
+                    tmp_info = (self._weighted_entropy_counts(left)
+                                + self._weighted_entropy_counts(right))
+                    if min_info - tmp_info > 1e-12 * max(tmp_info, 1.0):
+                        min_attribute_counts[SplitRecord.LESS] = split
+                        min_attribute_counts[SplitRecord.GREATER] = n - split
+                        min_info = tmp_info
+                        min_info_pivot = (sorted_x[split - 1]
+                                          + sorted_x[split]) / 2.0
         return CalcRecord(CalcRecord.NUM,
                           min_info * np.true_divide(1, n),
                           pivot=min_info_pivot,
                           attribute_counts=min_attribute_counts)
 
-    def _split_nominal(self, X_, examples_idx, calc_record):
+    def _split_nominal(self, x, examples_idx, calc_record):
         ft_idx = calc_record.feature_idx
-        values = self.encoders[ft_idx].encoded_classes_
+        values = self._encoded_classes[ft_idx]
+        # bucket the examples by value with one stable sort, 16 bit keys
+        # are radix sorted; the bags are views into the one sorted array
+        dtype = np.uint16 if len(values) <= 1 << 16 else np.intp
+        col = x.astype(dtype)
+        order = np.argsort(col, kind='stable')
+        offsets = np.zeros(len(values) + 1, dtype=np.intp)
+        np.cumsum(np.bincount(col, minlength=len(values)), out=offsets[1:])
+        flat = examples_idx[order]
         split_records = [None] * len(values)
         for val, i in enumerate(values):
-            split_records[i] = SplitRecord(calc_record,
-                                           examples_idx[X_[:, ft_idx]
-                                                        == val],
-                                           val)
+            split_records[i] = SplitRecord(
+                calc_record, flat[offsets[val]:offsets[val + 1]], val)
         return split_records
 
-    def _split_numerical(self, X_, examples_idx, calc_record):
-        idx = calc_record.feature_idx
+    def _split_numerical(self, x, examples_idx, calc_record):
+        less = x <= calc_record.pivot
         split_records = [None] * 2
         split_records[0] = SplitRecord(calc_record,
-                                       examples_idx[X_[:, idx]
-                                                    <= calc_record.pivot],
+                                       examples_idx[less],
                                        SplitRecord.LESS)
         split_records[1] = SplitRecord(calc_record,
-                                       examples_idx[X_[:, idx]
-                                                    > calc_record.pivot],
+                                       examples_idx[~less],
                                        SplitRecord.GREATER)
         return split_records
 
@@ -179,16 +475,26 @@ class Splitter():
         -------
         : float
         """
-        counts = calc_record.attribute_counts
-        s = np.true_divide(counts, np.sum(counts))
-        return np.abs(np.sum(np.multiply(s, np.log2(s))))
+        return self._entropy_counts(calc_record.attribute_counts)
 
     def _gain_ratio(self, calc_record):
-        return np.true_divide(calc_record.entropy - calc_record.info,
-                              self._intrinsic_value(calc_record))
+        """ Gain ratio of a CalcRecord, computed once and kept on the record
+
+        Parameters
+        ----------
+        calc_record : CalcRecord
+
+        Returns
+        -------
+        : float
+        """
+        if calc_record.gain_ratio is None:
+            calc_record.gain_ratio = ((calc_record.entropy - calc_record.info)
+                                      / self._intrinsic_value(calc_record))
+        return calc_record.gain_ratio
 
     def _is_close(self, a, b):
-        return np.abs(a + b) <= (1e-08 + 1e-05 * np.abs(b))
+        return np.abs(a - b) <= (1e-08 + 1e-05 * np.abs(b))
 
     def _is_better(self, calc_record1, calc_record2):
         """Compares CalcRecords using gain ratio if present otherwise
@@ -209,17 +515,49 @@ class Splitter():
         if calc_record2 is None:
             return False
         if self.gain_ratio:
-            if calc_record1.gain_ratio is None:
-                calc_record1.gain_ratio = self._gain_ratio(calc_record1)
-            if calc_record2.gain_ratio is None:
-                calc_record2.gain_ratio = self._gain_ratio(calc_record2)
-            if self._is_close(calc_record1.gain_ratio,
-                              calc_record2.gain_ratio):
-                return calc_record1.info > calc_record2.info
+            gain_ratio1 = self._gain_ratio(calc_record1)
+            gain_ratio2 = self._gain_ratio(calc_record2)
+            if self._is_close(gain_ratio1, gain_ratio2):
+                return self._has_more_info(calc_record1, calc_record2)
             else:
-                return calc_record1.gain_ratio < calc_record2.gain_ratio
+                return gain_ratio1 < gain_ratio2
         else:
-            return calc_record1.info > calc_record2.info
+            return self._has_more_info(calc_record1, calc_record2)
+
+    def _has_more_info(self, calc_record1, calc_record2):
+        """ If calc_record1 has more information than calc_record2, infos
+        equal up to rounding error count as ties so the first feature wins
+        regardless of how the infos were summed
+        """
+        return (calc_record1.info - calc_record2.info
+                > 1e-12 * max(np.abs(calc_record2.info), 1.0))
+
+    def _calc_feature(self, examples_idx, y_, ft_idx):
+        """ CalcRecord of a single feature, None if the feature is constant
+        for the remaining examples
+
+        Parameters
+        ----------
+        examples_idx : np.array of shape [n remaining examples]
+        y_ : np.array of shape [n remaining examples]
+            containing the classes of the remaining examples
+        ft_idx : int
+
+        Returns
+        -------
+        : CalcRecord or None
+        """
+        # calc already gathered y with examples_idx, which raises on an out
+        # of range index, clip only skips checking it a second time
+        feature = np.take(self.X[:, ft_idx], examples_idx, mode='clip',
+                          out=self._buffer('feature', examples_idx.size,
+                                           self.X.dtype))
+        if np.max(feature) == np.min(feature):
+            return None
+        if self.is_numerical[ft_idx]:
+            return self._info_numerical(feature, y_)
+        else:
+            return self._info_nominal(feature, y_)
 
     def calc(self, examples_idx, features_idx):
         """ Calculates information regarding optimal split based on
@@ -239,20 +577,22 @@ class Splitter():
         : float
             pivot used set1 < pivot <= set2
         """
-        X_ = self.X[np.ix_(examples_idx, features_idx)]
         y_ = self.y[examples_idx]
         calc_record = None
         alive_features = [True] * features_idx.shape[0]
         entropy, class_counts = self._entropy(y_, True)
-        for idx, feature in enumerate(X_.T):
-            if np.max(feature) == np.min(feature):
+        if (self.n_jobs in (None, 1)
+                or examples_idx.size < self.min_parallel_samples):
+            records = [self._calc_feature(examples_idx, y_, ft_idx)
+                       for ft_idx in features_idx]
+        else:
+            records = Parallel(n_jobs=self.n_jobs, prefer='threads')(
+                delayed(self._calc_feature)(examples_idx, y_, ft_idx)
+                for ft_idx in features_idx)
+        for idx, tmp_calc_record in enumerate(records):
+            if tmp_calc_record is None:
                 alive_features[idx] = False
                 continue
-            tmp_calc_record = None
-            if self.is_numerical[features_idx[idx]]:
-                tmp_calc_record = self._info_numerical(feature, y_)
-            else:
-                tmp_calc_record = self._info_nominal(feature, y_)
             tmp_calc_record.entropy = entropy
             tmp_calc_record.class_counts = class_counts
             if self._is_better(calc_record, tmp_calc_record):
@@ -262,8 +602,8 @@ class Splitter():
         return calc_record
 
     def split(self, examples_idx, calc_record):
-        X_ = self.X[np.ix_(examples_idx)]
+        x = self.X[examples_idx, calc_record.feature_idx]
         if self.is_numerical[calc_record.feature_idx]:
-            return self._split_numerical(X_, examples_idx, calc_record)
+            return self._split_numerical(x, examples_idx, calc_record)
         else:
-            return self._split_nominal(X_, examples_idx, calc_record)
+            return self._split_nominal(x, examples_idx, calc_record)
@@ -62,6 +62,7 @@ class TreeBuilder(BaseBuilder):
         self.y = y
         tree.root = self._build(tree, np.arange(self.n_samples),
                                 np.arange(self.n_features))
+        self.splitter.release()
         if self.prune:
             if X_test is None or y_test is None:
                 raise ValueError("Can't prune tree without validation data")
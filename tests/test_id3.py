@@ -1,8 +1,24 @@
+import pickle
+import pytest
 from sklearn.datasets import load_breast_cancer
 from numpy.testing import assert_almost_equal, assert_equal
 import numpy as np
 from src.id3 import Id3Estimator
 from src.id3.splitter import Splitter, CalcRecord
+from src.id3.splitter import (_splitter, njit, _fastmath, _argsort,
+                               _numerical_split_infos_np,
+                               _numerical_split_infos_nb,
+                               _nominal_info_np)
+
+# every kernel available here, not only the one the splitter picked
+numerical_split_infos_backends = [_numerical_split_infos_np]
+nominal_info_backends = [_nominal_info_np]
+if njit is not None:
+    numerical_split_infos_backends.append(
+        njit(nogil=True, fastmath=_fastmath)(_numerical_split_infos_nb))
+if _splitter is not None:
+    numerical_split_infos_backends.append(_splitter.numerical_split_infos)
+    nominal_info_backends.append(_splitter.nominal_info)
 
 
 y = np.array([0, 1, 2, 2, 3])
@@ -80,6 +96,28 @@ def test_entropy():
     assert_almost_equal(test_splitter._entropy(y), x)
 
 
+def test_is_close():
+    assert test_splitter._is_close(1.0, 1.0000000000000002)
+    assert not test_splitter._is_close(1.0, -1.0)
+    assert not test_splitter._is_close(0.5, 0.6)
+
+
+def test_is_better_ties():
+    splitter = Splitter(None, None, None, None, gain_ratio=True)
+    first = CalcRecord(CalcRecord.NUM, 0.5, gain_ratio=0.5)
+    # gain ratios equal up to rounding fall back to the info
+    second = CalcRecord(CalcRecord.NUM, 0.6, gain_ratio=0.5 + 1e-15)
+    assert not splitter._is_better(first, second)
+    assert splitter._is_better(second, first)
+    # equal records keep the first one
+    assert not splitter._is_better(first,
+                                   CalcRecord(CalcRecord.NUM, 0.5,
+                                              gain_ratio=0.5))
+    assert splitter._is_better(first,
+                               CalcRecord(CalcRecord.NUM, 0.6,
+                                          gain_ratio=0.7))
+
+
 def test_info_nominal():
     record = test_splitter._info_nominal(x_nominal_col, y)
     assert_equal(record.split_type, 1)
@@ -96,6 +134,65 @@ def test_info_numerical():
     assert_almost_equal(record.attribute_counts, [2, 3])
 
 
+def test_info_numerical_ties():
+    x = np.array([3, 1, 1, 3, 2, 2])
+    y_ = np.array([1, 0, 0, 1, 0, 1])
+    record = test_splitter._info_numerical(x, y_)
+    assert_almost_equal(record.pivot, 1.5)
+    assert_almost_equal(record.attribute_counts, [2, 4])
+    assert_almost_equal(record.info, 4 * 0.8112781 / 6)
+
+
+def test_argsort_radix():
+    rng = np.random.RandomState(0)
+    # integer values spanning more than 256 values take the uint16 sort
+    x = rng.randint(100, 1100, 500).astype(np.float32)
+    y_ = rng.randint(0, 3, 500)
+    sorted_idx = _argsort(x)
+    assert np.all(np.diff(x[sorted_idx]) >= 0)
+    assert_equal(sorted_idx, np.argsort(x, kind='stable'))
+    # shifted off the integers the same feature is sorted by quicksort
+    record = test_splitter._info_numerical(x, y_)
+    record_np = test_splitter._info_numerical(x + 0.5, y_)
+    assert_equal(record.pivot + 0.5, record_np.pivot)
+    assert_equal(record.info, record_np.info)
+    assert_equal(record.attribute_counts, record_np.attribute_counts)
+
+
+@pytest.mark.parametrize('numerical_split_infos',
+                         numerical_split_infos_backends)
+def test_numerical_split_infos(numerical_split_infos):
+    rng = np.random.RandomState(0)
+    xlog2x = test_splitter._xlog2x_table(200)
+    noisy = (np.sort(rng.randint(0, 20, 200)).astype(np.float32),
+             rng.randint(0, 3, 200))
+    # everything after the perfect split at 50 can be skipped
+    separable = (np.arange(200), (np.arange(200) >= 50).astype(np.int32))
+    for sorted_x, inv in [noisy, separable]:
+        n_classes = int(np.max(inv)) + 1
+        infos = numerical_split_infos(sorted_x, inv, n_classes, xlog2x)
+        infos_np = _numerical_split_infos_np(sorted_x, inv, n_classes,
+                                             xlog2x)
+        # positions skipped by the early exit cannot beat the minimum
+        scanned = np.isfinite(infos)
+        assert_almost_equal(infos[scanned], infos_np[scanned])
+        assert np.all(infos_np[~scanned] > np.min(infos))
+        assert_almost_equal(np.min(infos), np.min(infos_np))
+    assert_equal(np.argmin(infos), 49)
+
+
+@pytest.mark.parametrize('nominal_info', nominal_info_backends)
+def test_nominal_info(nominal_info):
+    rng = np.random.RandomState(0)
+    values = rng.randint(0, 4, 200).astype(np.int32)
+    y_ = rng.randint(0, 3, 200)
+    xlog2x = test_splitter._xlog2x_table(200)
+    info, count = nominal_info(values, y_, 4, 3, xlog2x)
+    info_np, count_np = _nominal_info_np(values, y_, 4, 3, xlog2x)
+    assert_almost_equal(info, info_np)
+    assert_equal(count, count_np)
+
+
 def test_numerical_split():
     bunch = load_breast_cancer()
 
@@ -112,6 +209,41 @@ def test_numerical_split():
     assert_almost_equal(len(split[1].bag), more)
 
 
+def test_calc_parallel():
+    bunch = load_breast_cancer()
+    id3Estimator = Id3Estimator()
+    id3Estimator.fit(bunch.data, bunch.target)
+    serial = id3Estimator.builder_.splitter
+    parallel = Splitter(serial.X, serial.y, serial.is_numerical,
+                        serial.encoders, n_jobs=2)
+    parallel.min_parallel_samples = 0
+    examples_idx = np.arange(bunch.target.shape[0])
+    features_idx = np.arange(bunch.data.shape[1])
+    record = serial.calc(examples_idx, features_idx)
+    parallel_record = parallel.calc(examples_idx, features_idx)
+    assert_equal(parallel_record.feature_idx, record.feature_idx)
+    assert_equal(parallel_record.info, record.info)
+    assert_equal(parallel_record.alive_features, record.alive_features)
+
+
+def test_pickle():
+    bunch = load_breast_cancer()
+    id3Estimator = Id3Estimator()
+    id3Estimator.fit(bunch.data, bunch.target)
+    # only the tree and one copy of the data are kept after the fit
+    splitter = id3Estimator.builder_.splitter
+    assert splitter.X is id3Estimator.builder_.X
+    assert splitter.y is id3Estimator.builder_.y
+    assert splitter._xlog2x is None
+    restored = pickle.loads(pickle.dumps(id3Estimator))
+    assert_equal(restored.predict(bunch.data),
+                 id3Estimator.predict(bunch.data))
+    examples_idx = np.arange(bunch.target.shape[0])
+    features_idx = np.arange(bunch.data.shape[1])
+    record = restored.builder_.splitter.calc(examples_idx, features_idx)
+    assert_equal(record.feature_idx, id3Estimator.tree_.root.value)
+
+
 def test_fit():
     bunch = load_breast_cancer()
 